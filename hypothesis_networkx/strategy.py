@@ -19,14 +19,89 @@ Provides the :mod:`hypothesis` strategy :func:`graph_builder` that can be used
 for building networkx graphs.
 """
 
+import math
+import operator
+
 from hypothesis import strategies as st
 import networkx as nx
 
+# Default strategies for node and edge attributes. Shared singletons, so that
+# graph_builder can recognize by identity when no attributes were requested
+# and skip the associated draws altogether.
+_NO_DATA = st.fixed_dictionaries({})
+
+
+# The functions below number all possible edges between n_nodes nodes: every
+# edge gets a rank in range(max_possible_edges), and ranks can be converted
+# back to edges. Which enumeration applies depends only on whether the graph
+# is directed and whether self loops are allowed, so there is one
+# edge_to_rank/rank_to_edge pair per case, looked up once per example via
+# _RANK_FUNCTIONS; the per-edge calls don't have to branch on the graph
+# shape. Undirected edges are in canonical (low, high) order. All functions
+# take n_nodes so they're interchangeable, even where it is unused.
+
+def _edge_to_rank_directed_loops(edge, n_nodes):
+    """The rank of a directed edge, self loops allowed."""
+    idx, jdx = edge
+    return idx * n_nodes + jdx
+
+
+def _rank_to_edge_directed_loops(rank, n_nodes):
+    """The directed edge with this rank, self loops allowed."""
+    return divmod(rank, n_nodes)
+
+
+def _edge_to_rank_directed(edge, n_nodes):
+    """The rank of a directed edge, self loops excluded."""
+    idx, jdx = edge
+    return idx * (n_nodes - 1) + jdx - (jdx > idx)
+
+
+def _rank_to_edge_directed(rank, n_nodes):
+    """The directed edge with this rank, self loops excluded."""
+    idx, jdx = divmod(rank, n_nodes - 1)
+    jdx += jdx >= idx
+    return idx, jdx
+
+
+def _edge_to_rank_undirected_loops(edge, n_nodes):
+    """The rank of an undirected edge, self loops allowed."""
+    idx, jdx = edge
+    return jdx * (jdx + 1) // 2 + idx
+
+
+def _rank_to_edge_undirected_loops(rank, n_nodes):
+    """The undirected edge with this rank, self loops allowed."""
+    jdx = (math.isqrt(8 * rank + 1) - 1) // 2
+    return rank - jdx * (jdx + 1) // 2, jdx
+
+
+def _edge_to_rank_undirected(edge, n_nodes):
+    """The rank of an undirected edge, self loops excluded."""
+    idx, jdx = edge
+    return jdx * (jdx - 1) // 2 + idx
+
+
+def _rank_to_edge_undirected(rank, n_nodes):
+    """The undirected edge with this rank, self loops excluded."""
+    jdx = (1 + math.isqrt(1 + 8 * rank)) // 2
+    return rank - jdx * (jdx - 1) // 2, jdx
+
+
+# (is_directed, self_loops) -> (edge_to_rank, rank_to_edge)
+_RANK_FUNCTIONS = {
+    (True, True): (_edge_to_rank_directed_loops, _rank_to_edge_directed_loops),
+    (True, False): (_edge_to_rank_directed, _rank_to_edge_directed),
+    (False, True): (_edge_to_rank_undirected_loops,
+                    _rank_to_edge_undirected_loops),
+    (False, False): (_edge_to_rank_undirected, _rank_to_edge_undirected),
+}
+
 
 @st.composite
 def graph_builder(draw,
-                  node_data=st.fixed_dictionaries({}),
-                  edge_data=st.fixed_dictionaries({}),
+                  node_data=_NO_DATA,
+                  edge_data=_NO_DATA,
                   node_keys=None,
                   min_nodes=0, max_nodes=25,
                   min_edges=0, max_edges=None,
@@ -87,7 +162,7 @@ def graph_builder(draw,
         raise ValueError('min_nodes can not be negative')
     if max_nodes is not None and min_nodes > max_nodes:
         raise ValueError('min_nodes must be less than or equal to max_nodes')
-    if max_nodes is not None and max_edges is not None and connected and max_edges < max_nodes-1:
+    if connected and max_nodes is not None and max_edges is not None and max_edges < max_nodes-1:
         raise ValueError("It's impossible to create a connected graph of {}"
                          "nodes with less than {} edges".format(max_nodes, max_nodes-1))
 
@@ -101,85 +176,134 @@ def graph_builder(draw,
     if not node_datas:
         return graph
 
+    n_nodes = len(node_datas)
     graph.add_nodes_from(enumerate(node_datas))
 
     # Draw a set of initial edges that guarantee that graph will be connected.
     # We use the invariant that all nodes < n_idx are connected. We create an
     # edge between n_idx and one of those before so that all nodes < n_idx + 1
     # are now connected.
+    initial_edges = []
     if connected:
         # Shrink towards high index, so shrink to the path graph. Otherwise
         # it'll shrink to the star graph.
-        initial_edges = [draw(st.tuples(st.integers(-(n_idx-1), 0).map(lambda x: -x),
-                                        st.just(n_idx)))
-                         for n_idx in range(1, len(graph))]
-        graph.add_edges_from(initial_edges)
+        # Only the parent index needs to be drawn; wrapping it in
+        # st.tuples/st.just just adds strategy overhead per edge.
+        initial_edges = [(draw(st.integers(-(n_idx-1), 0).map(operator.neg)), n_idx)
+                         for n_idx in range(1, n_nodes)]
 
     # Now for the mess. The maximum number of edges possible depends on the
     # graph type.
     if not is_multigraph:
         # Multi(Di)Graphs can make an infinite number of edges. For everything
         # else we clamp the range to (0, max_possible_edges)
-        max_possible_edges = len(graph) * (len(graph) - 1)
-        if is_directed:
-            max_possible_edges *= 2
+        max_possible_edges = n_nodes * (n_nodes - 1)
+        if not is_directed:
+            max_possible_edges //= 2
         if self_loops:
-            max_possible_edges += len(graph)
+            max_possible_edges += n_nodes
         if max_edges is None or max_edges > max_possible_edges:
             max_edges = max_possible_edges
+    # Counting graph.edges walks the adjacency dicts, but we know exactly
+    # how many edges have been made so far.
+    n_edges_made = len(initial_edges)
     if max_edges is not None:
         # Correct for number of edges already made if graph is connected.
         # This may mean we added more edges than originally allowed.
-        max_edges -= len(graph.edges)
+        max_edges -= n_edges_made
         if max_edges < 0:
             max_edges = 0
 
     # Likewise for min_edges
     # We already added some edges, so subtract those.
-    min_edges -= len(graph.edges)
+    min_edges -= n_edges_made
     if min_edges < 0:
         min_edges = 0
     elif max_edges is not None and min_edges > max_edges:
         min_edges = max_edges
 
-    def edge_filter(edge):
-        """
-        Helper function to decide whether the edge between idx and jdx can still
-        be added to graph.
-        """
-        # <= because self loops
-        idx, jdx = edge
-        return ((not graph.has_edge(idx, jdx) or is_multigraph) and
-                (idx <= jdx or is_directed) and
-                (idx != jdx or self_loops))
-
-    # We need to sample a number of items from options, these items are
-    # possibly not unique. In addition, we need to draw the same number of
-    # items from edge_data and associate the two. To top it off, uniqueness
-    # is defined by the content of the first element of the tuple.
-    edges = st.lists(
-        st.tuples(
-            st.integers(min_value=0, max_value=len(graph) - 1),
-            st.integers(min_value=0, max_value=len(graph) - 1),
-        ).filter(edge_filter),
-        unique=not is_multigraph,
-        min_size=min_edges,
-        max_size=max_edges
-    )
-    graph.add_edges_from(draw(edges))
-
-    edge_datas = draw(st.lists(
-        edge_data,
-        min_size=len(graph.edges),
-        max_size=len(graph.edges)
-    ))
-    for edge, data in zip(graph.edges, edge_datas):
-        graph.edges[edge].update(data)
+    # All edges end up in edge_list first, and enter the graph in a single
+    # add_edges_from call at the end with their data folded in; that is one
+    # bulk dict update per edge instead of per-edge method dispatch.
+    edge_list = initial_edges
+    if max_edges == 0:
+        # No more edges can be added, so don't bother setting up the edge
+        # sampler at all. Shrinking explores this case a lot.
+        pass
+    elif not is_multigraph:
+        # Every possible edge has a rank in range(max_possible_edges); draw
+        # unique ranks and unrank them to node pairs. This way Hypothesis
+        # never has to reject a drawn edge, and the O(n^2) candidate list
+        # never has to be materialized. The edges already made for
+        # connectivity are excluded by their rank: membership in a set of
+        # ints is much cheaper than has_edge's walk through the adjacency
+        # dicts.
+        edge_to_rank, rank_to_edge = _RANK_FUNCTIONS[is_directed, self_loops]
+        placed_ranks = {edge_to_rank(edge, n_nodes)
+                        for edge in initial_edges}
+        edge_ranks = st.integers(min_value=0,
+                                 max_value=max_possible_edges - 1)
+        if placed_ranks:
+            edge_ranks = edge_ranks.filter(
+                lambda rank: rank not in placed_ranks)
+        ranks = draw(st.lists(edge_ranks,
+                              unique=True,
+                              min_size=min_edges,
+                              max_size=max_edges))
+        edge_list = initial_edges + [rank_to_edge(rank, n_nodes)
+                                     for rank in ranks]
+    else:
+        # Multigraphs can repeat edges, so there is no finite candidate
+        # list to index into; draw the pairs directly. Drawing a node index
+        # plus an offset (rather than two indices and a filter) means no
+        # draw ever has to be rejected: the offset skips idx itself when
+        # self loops are not allowed.
+        max_offset = n_nodes - 1 if self_loops else n_nodes - 2
+
+        def make_edge(edge, n_nodes=n_nodes, is_directed=is_directed,
+                      shift=0 if self_loops else 1):
+            idx, offset = edge
+            jdx = (idx + offset + shift) % n_nodes
+            if not is_directed and jdx < idx:
+                # Canonical order, mostly to help shrinking.
+                idx, jdx = jdx, idx
+            return (idx, jdx)
+
+        if max_offset >= 0:
+            edges = st.lists(
+                st.tuples(
+                    st.integers(min_value=0, max_value=n_nodes - 1),
+                    st.integers(min_value=0, max_value=max_offset),
+                ).map(make_edge),
+                min_size=min_edges,
+                max_size=max_edges
+            )
+            edge_list = initial_edges + draw(edges)
+
+    if edge_data is not _NO_DATA:
+        # When edge_data is left at its default every draw would produce {},
+        # so skip drawing them and add the bare edges instead.
+        edge_datas = draw(st.lists(
+            edge_data,
+            min_size=len(edge_list),
+            max_size=len(edge_list)
+        ))
+        graph.add_edges_from((idx, jdx, data) for (idx, jdx), data
+                             in zip(edge_list, edge_datas))
+    else:
+        graph.add_edges_from(edge_list)
 
     if node_keys is not None:
-        new_idxs = draw(st.sets(node_keys,
-                                min_size=len(graph),
-                                max_size=len(graph)))
-        graph = nx.relabel_nodes(graph, dict(zip(list(graph), list(new_idxs))))
+        new_idxs = draw(st.lists(node_keys,
+                                 unique=True,
+                                 min_size=n_nodes,
+                                 max_size=n_nodes))
+        # The graph was built with the node labels 0..n_nodes-1, so there's
+        # no need to materialize the node view to find them.
+        mapping = dict(zip(range(n_nodes), new_idxs))
+        # Relabelling in place saves copying the whole graph, but is not
+        # always possible when the old and new labels overlap.
+        copy = any(new_idx in graph for new_idx in new_idxs)
+        graph = nx.relabel_nodes(graph, mapping, copy=copy)
 
     return graph
@@ -15,6 +15,9 @@
 # limitations under the License.
 
 
+from collections import deque
+import itertools
+
 from hypothesis import strategies as st
 from hypothesis import given, settings, HealthCheck, note
 
@@ -27,6 +30,28 @@ from hypothesis_networkx import graph_builder
 # pylint: disable=no-value-for-parameter
 
 
+def _is_connected(graph):
+    """
+    Tells whether graph is (weakly) connected using a plain BFS over the
+    adjacency dicts. nx.is_connected/nx.is_weakly_connected go through
+    connected_components, which is a lot more machinery than this check
+    needs, and this runs for every example.
+    """
+    if graph.is_directed():
+        def neighbors(node):
+            return itertools.chain(graph.pred[node], graph.succ[node])
+    else:
+        neighbors = graph.adj.__getitem__
+    seen = {next(iter(graph))}
+    queue = deque(seen)
+    while queue:
+        for neighbor in neighbors(queue.popleft()):
+            if neighbor not in seen:
+                seen.add(neighbor)
+                queue.append(neighbor)
+    return len(seen) == len(graph)
+
+
 @settings(max_examples=250, suppress_health_check=[HealthCheck.too_slow])
 @given(st.data())
 def test_graph_builder(data):
@@ -41,6 +66,7 @@ def test_graph_builder(data):
     node_keys = st.integers()
 
     multigraph = graph_type in [nx.MultiGraph, nx.MultiDiGraph]
+    directed = graph_type in [nx.DiGraph, nx.MultiDiGraph]
 
     min_nodes = data.draw(st.integers(min_value=0, max_value=25),
                           label='min nodes')
@@ -66,17 +92,20 @@ def test_graph_builder(data):
                              graph_type=graph_type)
     graph = data.draw(strategy)
 
-    note("Number of nodes: {}".format(len(graph)))
-    note("Number of edges: {}".format(len(graph.edges)))
+    # Counting nodes and edges walks the graph's dicts, so do it just once.
+    n_nodes = graph.number_of_nodes()
+    n_edges = graph.number_of_edges()
+    note("Number of nodes: {}".format(n_nodes))
+    note("Number of edges: {}".format(n_edges))
 
-    if isinstance(graph, nx.DiGraph):
-        max_possible_edges = len(graph.nodes) * (len(graph.nodes) - 1)
-    elif isinstance(graph, nx.Graph):
-        max_possible_edges = len(graph.nodes) * (len(graph.nodes) - 1)//2
-    if isinstance(graph, nx.MultiGraph):
+    if multigraph:
         max_possible_edges = float('inf')
+    elif directed:
+        max_possible_edges = n_nodes * (n_nodes - 1)
+    else:
+        max_possible_edges = n_nodes * (n_nodes - 1)//2
     if self_loops:
-        max_possible_edges += len(graph.nodes)
+        max_possible_edges += n_nodes
 
     if max_edges is None:
         max_edges = float('inf')
@@ -85,20 +114,19 @@ def test_graph_builder(data):
 
     if min_edges > max_possible_edges:
         min_edges = max_possible_edges
-    if len(graph) < 2:
+    if n_nodes < 2:
         min_edges = 0
     note('min_edges: {}'.format(min_edges))
     note('max_edges: {}'.format(max_edges))
 
     assert isinstance(graph, graph_type)
-    assert min_nodes <= len(graph.nodes) <= max_nodes
-    assert min_edges <= len(graph.edges) <= max_edges
-    assert self_loops or nx.number_of_selfloops(graph) == 0
+    assert min_nodes <= n_nodes <= max_nodes
+    assert min_edges <= n_edges <= max_edges
+    # Single pass over the edges; nx.number_of_selfloops does the same but
+    # by way of a full loop-edge view.
+    assert self_loops or not any(edge[0] == edge[1] for edge in graph.edges)
     if graph:
-        if isinstance(graph, nx.DiGraph):
-            assert not connected or nx.is_weakly_connected(graph)
-        else:
-            assert not connected or nx.is_connected(graph)
+        assert not connected or _is_connected(graph)
 
 
 def test_multigraph_max_edges_none():